@@ -15,11 +15,22 @@ import os
 import json
 import psutil
 import platform
+import socket
+import threading
+import queue
+import time
+import hashlib
 from datetime import datetime
 
 # Regex for matching whole number or float percentage
 RE_PER_NUMBER = re.compile(r'([0-9]+.?[0-9]*)%')
 RE_EBE_VERSION = re.compile(r'Ebe ([0-9]+\.[0-9]+\.[0-9]+)')
+# Extension of the sample journal file
+JOURNAL_EXT = ".journal"
+# Options of the run plan stored in journal header
+PLAN_OPTIONS = {"ebec": "-ebec", "ebei": "-ebei", "iterations": "-iter", "tests": "-t", "only_i": "-i", "only_c": "-c"}
+# Seconds after which worker not answering a job is dropped
+JOB_TIMEOUT = 60*10
 # Option to exit on warning
 werror = False
 
@@ -40,6 +51,17 @@ def print_help():
     -iter <num>  Number of iteration to be done for each test.
     -args "args" Extra compilation arguments.
     -Werror      Exits with error on warning.
+    -resume <path> Resumes benchmarks from a journal file, running only
+                 samples that are not yet in it. Options -ebec, -ebei,
+                 -iter, -t, -i and -c are taken from the journal.
+    -serve <[host:]port> Runs as a worker agent accepting tests from a
+                 coordinator. Listens only on localhost unless host is set.
+    -worker <host:port> Runs tests on worker agent instead of locally. Can be
+                 used multiple times.
+    -jobtimeout <sec> Seconds after which worker not answering a job is
+                 dropped and the job is given to other workers.
+    Every finished sample is appended to a journal file (results file with
+    .journal extension), from which the results are assembled.
     """.format(sys.argv[0]))
     exit(0)
 
@@ -60,13 +82,14 @@ def log(msg, test=None, test_number=None, test_amount=None):
     :param test_number Test number
     :param test_amount Amount of all tests
     """
+    # Line is printed at once, so that lines from worker threads do not interleave
     if test_number is not None and test_amount is not None:
-        print("TEST({}/{}): ".format(test_number, test_amount), end="", file=sys.stderr)
+        line = "TEST({}/{}): ".format(test_number, test_amount)
     else:
-        print("INFO: ", end="", file=sys.stderr)
+        line = "INFO: "
     if test is not None:
-        print(test+": ", end="", file=sys.stderr)
-    print(msg, file=sys.stderr)
+        line += test+": "
+    print(line+msg, file=sys.stderr)
 
 def get_ebe_version(ebe):
     """
@@ -258,7 +281,135 @@ def get_ebei_tests(dir_path, allowed):
             tests.append((item, ebel_file, txt_files, extract_args(args_file)))
     return tests
 
-def run_ebec_tests(ebe, ebec_dir, iterations, extra_args, tests):
+def get_test_hash(test):
+    """
+    Computes hash of test's files and arguments
+    :param test Test touple (see get_ebec_tests and get_ebei_tests)
+    :return Hash as a hexadecimal string
+    """
+    files = []
+    for f in test[1:-1]:
+        files += f if isinstance(f, list) else [f]
+    sha = hashlib.sha256()
+    for f in sorted(files, key=os.path.basename):
+        sha.update(os.path.basename(f).encode("utf-8"))
+        with open(f, "rb") as f_r:
+            for chunk in iter(lambda: f_r.read(1 << 20), b""):
+                sha.update(chunk)
+    sha.update(test[-1].encode("utf-8"))
+    return sha.hexdigest()
+
+def open_journal(path, header=None):
+    """
+    Opens journal file for appending samples
+    :param path Path to the journal file
+    :param header Header to write as the first record or None when resuming
+    :return Opened journal file
+    """
+    if header is not None and os.path.exists(path):
+        error("Journal '{}' already exists, use -resume to continue it".format(path))
+    journal = open(path, "a+")
+    # Terminate record cut off by a crash so that new records are not appended to it
+    if journal.tell() > 0:
+        journal.seek(journal.tell()-1)
+        if journal.read(1) != "\n":
+            journal.write("\n")
+    if header is not None:
+        write_journal(journal, {"journal": header})
+    return journal
+
+def write_journal(journal, record):
+    """
+    Appends one record to the journal and makes sure it is on the disk
+    :param journal Opened journal file
+    :param record Record (dict) to write
+    """
+    journal.write(json.dumps(record)+"\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+def load_journal(path):
+    """
+    Loads journal file
+    :param path Path to the journal file
+    :return Touple of (header, list of sample records, dict of workers)
+    """
+    header = None
+    samples = []
+    workers = {}
+    with open(path, "r") as f_j:
+        for line in f_j:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Last record might be cut off by a crash
+                log("Skipping malformed journal record.", path)
+                continue
+            if "journal" in record:
+                if header is not None:
+                    error("Journal '{}' contains multiple headers".format(path))
+                header = record["journal"]
+            elif "platform" in record:
+                workers[record["worker"]] = {"platform": record["platform"], "ebe": record["ebe"]}
+            else:
+                samples.append(record)
+    if header is None:
+        error("Journal '{}' is missing its header".format(path))
+    return (header, samples, workers)
+
+def get_done_samples(samples):
+    """
+    :param samples Journal sample records
+    :return Set of (mode, test name, iteration) touples already measured
+    """
+    return {(s["mode"], s["test"], s["iteration"]) for s in samples}
+
+def get_journal_results(samples, mode, tests, iterations):
+    """
+    Assembles results for one mode from journal samples
+    :param samples Journal sample records
+    :param mode "ebec" or "ebei"
+    :param tests Tests to include or None to include all
+    :param iterations Amount of iterations to include
+    :return Results dictionary or None if there are no samples for mode
+    """
+    results = {}
+    samples = [s for s in samples if s["mode"] == mode and s["iteration"] < iterations and
+               (tests is None or s["test"] in tests)]
+    for s in sorted(samples, key=lambda s: s["iteration"]):
+        if s["test"] not in results:
+            results[s["test"]] = {"times": [], "cpus": [], "workers": []}
+            if mode == "ebec":
+                results[s["test"]]["precisions"] = []
+        results[s["test"]]["times"].append(s["time"])
+        results[s["test"]]["cpus"].append(s["cpu"])
+        results[s["test"]]["workers"].append(s.get("worker"))
+        if mode == "ebec":
+            results[s["test"]]["precisions"].append(s["precision"])
+    # Worker is tracked only for distributed benchmarks
+    for v in results.values():
+        if all(w is None for w in v["workers"]):
+            del v["workers"]
+    return results if len(results) > 0 else None
+
+def measure_sample(ebe, mode, test, extra_args):
+    """
+    Measures one sample of a test
+    :param ebe Path to ebe
+    :param mode "ebec" or "ebei"
+    :param test Test touple (see get_ebec_tests and get_ebei_tests)
+    :param extra_args Additional arguments
+    :return Sample as a dict
+    """
+    if mode == "ebec":
+        _, f_in, f_out, args = test
+        mes = measure_ebec(ebe, f_in, f_out, extra_args+" "+args)
+        return {"time": float(mes[0]), "cpu": int(mes[1]), "precision": float(mes[2])}
+    _, f_ebel, f_ins, args = test
+    mes = measure_ebei(ebe, f_ebel, f_ins, args)
+    return {"time": float(mes[0]), "cpu": int(mes[1])}
+
+def run_ebec_tests(ebe, ebec_dir, iterations, extra_args, tests, journal, done):
     """
     Benchmarks all ebec tests in ebe_dir
     :param ebe Path to ebe
@@ -266,45 +417,310 @@ def run_ebec_tests(ebe, ebec_dir, iterations, extra_args, tests):
     :param iterations Amount of iterations
     :param extra_args Additional arguments
     :param tests Tests to run on None to run all
+    :param journal Opened journal file to which samples are written
+    :param done Set of already measured samples (see get_done_samples)
     """
-    results = {}
     tests = get_ebec_tests(ebec_dir, tests)
     log("Running {} ebec tests ({} iterations).".format(len(tests), iterations))
     curr_num = 1
-    for name, f_in, f_out, args in tests:
-        results[name] = {"times": [], "cpus": [], "precisions": []}
+    for test in tests:
+        name = test[0]
         log("Started.", "ebec:"+name, curr_num, len(tests))
-        for _ in range(iterations):
-            mes = measure_ebec(ebe, f_in, f_out, extra_args+" "+args)
-            results[name]["times"].append(float(mes[0]))
-            results[name]["cpus"].append(int(mes[1]))
-            results[name]["precisions"].append(float(mes[2]))
+        for i in range(iterations):
+            if ("ebec", name, i) in done:
+                continue
+            try:
+                sample = measure_sample(ebe, "ebec", test, extra_args)
+            except (ValueError, AttributeError):
+                warning("Could not measure iteration {}. Skipping it".format(i), "ebec:"+name)
+                continue
+            write_journal(journal, {"mode": "ebec", "test": name, "iteration": i, **sample})
         log("Finished.", "ebec:"+name, curr_num, len(tests))
         curr_num += 1
-    return results
 
-def run_ebei_tests(ebe, ebei_dir, iterations, tests):
+def run_ebei_tests(ebe, ebei_dir, iterations, tests, journal, done):
     """
     Benchmarks all ebei tests in ebe_dir
     :param ebe Path to ebe
     :param ebei_dir Path to ebei tests
     :param iterations Amount of iterations
     :param tests Tests to run on None to run all
+    :param journal Opened journal file to which samples are written
+    :param done Set of already measured samples (see get_done_samples)
     """
-    results = {}
     tests = get_ebei_tests(ebei_dir, tests)
     log("Running {} ebei tests ({} iterations).".format(len(tests), iterations))
     curr_num = 1
-    for name, f_ebel, f_ins, args in tests:
-        results[name] = {"times": [], "cpus": []}
+    for test in tests:
+        name = test[0]
         log("Started.", "ebei:"+name, curr_num, len(tests))
-        for _ in range(iterations):
-            mes = measure_ebei(ebe, f_ebel, f_ins, args)
-            results[name]["times"].append(float(mes[0]))
-            results[name]["cpus"].append(int(mes[1]))
+        for i in range(iterations):
+            if ("ebei", name, i) in done:
+                continue
+            try:
+                sample = measure_sample(ebe, "ebei", test, "")
+            except (ValueError, AttributeError):
+                warning("Could not measure iteration {}. Skipping it".format(i), "ebei:"+name)
+                continue
+            write_journal(journal, {"mode": "ebei", "test": name, "iteration": i, **sample})
         log("Finished.", "ebei:"+name, curr_num, len(tests))
         curr_num += 1
-    return results
+
+def send_message(f_sock, msg):
+    """
+    Sends one message (a line of json) over a socket
+    :param f_sock Socket file
+    :param msg Message as a dict
+    """
+    f_sock.write(json.dumps(msg)+"\n")
+    f_sock.flush()
+
+def recv_message(f_sock):
+    """
+    Receives one message (a line of json) from a socket
+    :param f_sock Socket file
+    :return Message as a dict
+    """
+    line = f_sock.readline()
+    if len(line) == 0:
+        raise ConnectionError("Connection closed")
+    return json.loads(line)
+
+def check_job(job, tests):
+    """
+    Checks that job received by a worker is well formed
+    :param job Received job
+    :param tests Dictionary of worker's tests for each mode
+    :return Error message or None if job is correct
+    """
+    if not isinstance(job, dict) or job.get("type") != "job":
+        return "Message is not a job"
+    if job.get("mode") not in ("ebec", "ebei"):
+        return "Unknown mode"
+    if not isinstance(job.get("test"), str) or job["test"] not in tests[job["mode"]]:
+        return "Test not found on worker"
+    if not isinstance(job.get("iteration"), int) or job["iteration"] < 0:
+        return "Incorrect iteration"
+    return None
+
+def run_worker(ebe, ebec_dir, ebei_dir, extra_args, host, port):
+    """
+    Runs worker agent, which accepts jobs from a coordinator and measures them.
+    Worker sends "hello" message with its platform, Ebe information,
+    arguments and hashes of its tests and then answers every "job" message with a "sample" or an
+    "error" message. Arguments are set only on the worker, jobs contain just
+    test name, so coordinator cannot run arbitrary commands.
+    :param ebe Path to ebe
+    :param ebec_dir Path to ebec tests
+    :param ebei_dir Path to ebei tests
+    :param extra_args Additional arguments
+    :param host Address to listen on
+    :param port Port to listen on
+    """
+    tests = {"ebec": {t[0]: t for t in get_ebec_tests(ebec_dir, None)},
+             "ebei": {t[0]: t for t in get_ebei_tests(ebei_dir, None)}}
+    hello = {"type": "hello", "platform": get_platform_info(), "ebe": get_ebe_info(ebe), "args": extra_args,
+             "tests": {m: {k: get_test_hash(t) for k, t in v.items()} for m, v in tests.items()}}
+    server = socket.create_server((host, port))
+    log("Worker listening on {}:{}.".format(host, port))
+    while True:
+        conn, addr = server.accept()
+        log("Coordinator {} connected.".format(addr[0]))
+        with conn, conn.makefile("rw") as f_sock:
+            try:
+                send_message(f_sock, hello)
+                while True:
+                    job = recv_message(f_sock)
+                    job_error = check_job(job, tests)
+                    if job_error is not None:
+                        send_message(f_sock, {"type": "error", "msg": job_error})
+                        continue
+                    name = "{}:{}".format(job["mode"], job["test"])
+                    try:
+                        sample = measure_sample(ebe, job["mode"], tests[job["mode"]][job["test"]],
+                                                extra_args if job["mode"] == "ebec" else "")
+                    except (ValueError, AttributeError):
+                        send_message(f_sock, {"type": "error", "msg": "Could not measure iteration {}".format(job["iteration"])})
+                        continue
+                    log("Measured iteration {}.".format(job["iteration"]), name)
+                    send_message(f_sock, {"type": "sample", **sample})
+            except ConnectionError:
+                pass
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                log("Connection failed ({}).".format(e), "coordinator "+addr[0])
+        log("Coordinator {} disconnected.".format(addr[0]))
+
+def connect_worker(address, extra_args, timeout):
+    """
+    Connects to a worker agent
+    :param address Worker address as host:port
+    :param extra_args Additional arguments, which have to match worker's
+    :param timeout Seconds to wait for worker's answer
+    :return Touple of (address, socket, socket file, hello message)
+    """
+    host, _, port = address.rpartition(":")
+    try:
+        sock = socket.create_connection((host, int(port)), timeout=timeout)
+        f_sock = sock.makefile("rw")
+        hello = recv_message(f_sock)
+    except (OSError, ValueError) as e:
+        error("Cannot connect to worker '{}' ({})".format(address, e))
+    try:
+        valid = (hello["type"] == "hello" and isinstance(hello["args"], str) and
+                 isinstance(hello["ebe"]["version"], str) and isinstance(hello["platform"], dict) and
+                 all(isinstance(hello["tests"][m], dict) for m in ("ebec", "ebei")))
+    except (KeyError, TypeError):
+        valid = False
+    if not valid:
+        error("Unexpected handshake from worker '{}', it might run different version of benchmarks".format(address))
+    if hello["args"] != extra_args:
+        error("Worker '{}' was started with -args '{}', but '{}' was given".format(address, hello["args"], extra_args))
+    log("Connected to worker '{}' (Ebe {}).".format(address, hello["ebe"]["version"]))
+    return (address, sock, f_sock, hello)
+
+def check_reply(reply, job):
+    """
+    Checks that reply received by a coordinator is well formed
+    :param reply Received reply
+    :param job Job, to which the reply belongs
+    :return Error message or None if reply is correct
+    """
+    if not isinstance(reply, dict):
+        return "Reply is not a message"
+    if reply.get("type") == "error":
+        return None if isinstance(reply.get("msg"), str) else "Error without a message"
+    if reply.get("type") != "sample":
+        return "Unknown reply"
+    keys = ("time", "cpu", "precision") if job["mode"] == "ebec" else ("time", "cpu")
+    if not all(isinstance(reply.get(k), (int, float)) for k in keys):
+        return "Incorrect sample"
+    return None
+
+def coordinate_worker(worker, jobs, journal, lock, state):
+    """
+    Sends jobs to a worker until there are none left.
+    Jobs are taken one at a time from a shared queue, so faster workers take
+    more of them. Jobs of workers, which disconnect, do not answer in time or
+    send incorrect replies, are returned to the queue and such worker is dropped.
+    Jobs, which worker could not measure, are given to other workers.
+    :param worker Connected worker (see connect_worker)
+    :param jobs Queue of (job, list of workers which could not measure it)
+    :param journal Opened journal file to which samples are written
+    :param lock Lock for writing into the journal and accessing state
+    :param state Dictionary with amount of "pending" jobs, set of "alive"
+                 workers and list of "failed" (job, error message) touples
+    """
+    address, sock, f_sock, _ = worker
+    item = None
+    try:
+        while True:
+            try:
+                item = jobs.get(timeout=1)
+            except queue.Empty:
+                # Job might still be returned by a disconnected worker
+                with lock:
+                    if state["pending"] == 0:
+                        break
+                continue
+            job, tried = item
+            name = "{}:{}".format(job["mode"], job["test"])
+            if address in tried:
+                with lock:
+                    give_up = len(state["alive"]-set(tried)) == 0
+                    if give_up:
+                        state["failed"].append((job, "No other worker can measure it"))
+                        state["pending"] -= 1
+                if not give_up:
+                    # Leave the job for other workers
+                    jobs.put(item)
+                    time.sleep(0.1)
+                item = None
+                continue
+            try:
+                send_message(f_sock, {"type": "job", **job})
+                reply = recv_message(f_sock)
+            except socket.timeout:
+                log("Worker '{}' did not answer in time. Returning its job to the queue.".format(address), name)
+                break
+            except (OSError, ValueError) as e:
+                log("Worker '{}' disconnected ({}). Returning its job to the queue.".format(address, e), name)
+                break
+            reply_error = check_reply(reply, job)
+            if reply_error is not None:
+                log("Worker '{}' sent incorrect reply ({}). Returning its job to the queue.".format(address, reply_error), name)
+                break
+            if reply["type"] == "sample":
+                sample = {k: reply[k] for k in ("time", "cpu", "precision") if k in reply}
+                with lock:
+                    write_journal(journal, {**job, "worker": address, **sample})
+                    state["pending"] -= 1
+                log("Measured iteration {} on '{}'.".format(job["iteration"], address), name)
+            else:
+                log("Worker '{}': {}. Returning its job to the queue.".format(address, reply["msg"]), name)
+                tried.append(address)
+                with lock:
+                    give_up = len(state["alive"]-set(tried)) == 0
+                    if give_up:
+                        state["failed"].append((job, reply["msg"]))
+                        state["pending"] -= 1
+                if not give_up:
+                    jobs.put(item)
+            item = None
+    finally:
+        with lock:
+            state["alive"].discard(address)
+        # Unfinished job is returned to the queue for other workers
+        if item is not None:
+            jobs.put(item)
+        f_sock.close()
+        sock.close()
+
+def run_distributed_tests(workers, ebec_dir, ebei_dir, iterations, tests, journal, done, only_i, only_c):
+    """
+    Benchmarks tests on worker agents
+    :param workers List of connected workers (see connect_worker)
+    :param ebec_dir Path to ebec tests
+    :param ebei_dir Path to ebei tests
+    :param iterations Amount of iterations
+    :param tests Tests to run on None to run all
+    :param journal Opened journal file to which samples are written
+    :param done Set of already measured samples (see get_done_samples)
+    :param only_i If True then only ebei tests are run
+    :param only_c If True then only ebec tests are run
+    """
+    lock = threading.Lock()
+    jobs = queue.Queue()
+    test_lists = []
+    if not only_i:
+        test_lists.append(("ebec", get_ebec_tests(ebec_dir, tests)))
+    if not only_c:
+        test_lists.append(("ebei", get_ebei_tests(ebei_dir, tests)))
+    # Same named tests with different content cannot be merged
+    for mode, mode_tests in test_lists:
+        for test in mode_tests:
+            test_hash = get_test_hash(test)
+            for address, _, _, hello in workers:
+                if hello["tests"][mode].get(test[0], test_hash) != test_hash:
+                    error("Test '{}:{}' on worker '{}' differs from the local one".format(mode, test[0], address))
+    for mode, mode_tests in test_lists:
+        for test in mode_tests:
+            for i in range(iterations):
+                if (mode, test[0], i) not in done:
+                    jobs.put(({"mode": mode, "test": test[0], "iteration": i}, []))
+    state = {"pending": jobs.qsize(), "alive": {w[0] for w in workers}, "failed": []}
+    log("Running {} samples on {} workers.".format(state["pending"], len(workers)))
+    for address, _, _, hello in workers:
+        write_journal(journal, {"worker": address, "platform": hello["platform"], "ebe": hello["ebe"]})
+    threads = [threading.Thread(target=coordinate_worker, args=(w, jobs, journal, lock, state)) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for job, msg in state["failed"]:
+        warning("Could not measure iteration {} on any worker ({})".format(job["iteration"], msg),
+                "{}:{}".format(job["mode"], job["test"]))
+    if not jobs.empty():
+        warning("{} samples were not measured, because all workers disconnected".format(jobs.qsize()), "coordinator")
 
 # Entry point, use -h to see usage information
 if __name__ == "__main__":
@@ -324,6 +740,13 @@ if __name__ == "__main__":
     _extra_args = ""
     _json_name = None
     _tests = []
+    _resume = None
+    _serve = None
+    _serve_host = ""
+    _worker_addrs = []
+    _job_timeout = JOB_TIMEOUT
+    # Options of the run plan set by the user
+    _given = set()
 
     _i = 1
     while _i < len(sys.argv):
@@ -333,16 +756,19 @@ if __name__ == "__main__":
             _ebe_command = sys.argv[_i+1]
             _i += 1
         elif sys.argv[_i] == "-ebec":
+            _given.add("ebec")
             if len(sys.argv) <= _i+1:
                 error("Missing value for -ebec option")
             _ebec_dir = sys.argv[_i+1]
             _i += 1
         elif sys.argv[_i] == "-ebei":
+            _given.add("ebei")
             if len(sys.argv) <= _i+1:
                 error("Missing value for -ebei option")
             _ebei_dir = sys.argv[_i+1]
             _i += 1
         elif sys.argv[_i] == "-iter":
+            _given.add("iterations")
             if len(sys.argv) <= _i+1:
                 error("Missing value for -iter option")
             try:
@@ -361,13 +787,43 @@ if __name__ == "__main__":
             _json_dir = sys.argv[_i+1]
             _i += 1
         elif sys.argv[_i] == "-t":
+            _given.add("tests")
             if len(sys.argv) <= _i+1:
                 error("Missing value for -t option")
             _tests.append(sys.argv[_i+1])
             _i += 1
+        elif sys.argv[_i] == "-resume":
+            if len(sys.argv) <= _i+1:
+                error("Missing value for -resume option")
+            _resume = sys.argv[_i+1]
+            _i += 1
+        elif sys.argv[_i] == "-serve":
+            if len(sys.argv) <= _i+1:
+                error("Missing value for -serve option")
+            _serve_host, _, _serve = sys.argv[_i+1].rpartition(":")
+            try:
+                _serve = int(_serve)
+            except Exception:
+                error("Incorrect value '{}' for -serve".format(sys.argv[_i+1]))
+            _i += 1
+        elif sys.argv[_i] == "-worker":
+            if len(sys.argv) <= _i+1:
+                error("Missing value for -worker option")
+            _worker_addrs.append(sys.argv[_i+1])
+            _i += 1
+        elif sys.argv[_i] == "-jobtimeout":
+            if len(sys.argv) <= _i+1:
+                error("Missing value for -jobtimeout option")
+            try:
+                _job_timeout = float(sys.argv[_i+1])
+            except Exception:
+                error("Incorrect value '{}' for -jobtimeout".format(sys.argv[_i+1]))
+            _i += 1
         elif sys.argv[_i] == "-i":
+            _given.add("only_i")
             _only_i = True
         elif sys.argv[_i] == "-c":
+            _given.add("only_c")
             _only_c = True
         elif sys.argv[_i] == "-Werror":
             werror = True
@@ -375,13 +831,28 @@ if __name__ == "__main__":
             error("Unknown option '{}'".format(sys.argv[_i]))
         _i += 1
 
-    log("Using:\n\t-ebec: {}\n\t-ebei: {}\n\t-ebe: {}\n\t-o: {}\n\t-iter: {}\n\t-args: {}\n\t-i: {}\n\t-c: {}\n\t-t: {}\n\t-Werror: {}".format(
-          _ebec_dir, _ebei_dir, _ebe_command, _json_dir, _iterations, _extra_args, _only_i, _only_c, _tests, werror))
+    log("Using:\n\t-ebec: {}\n\t-ebei: {}\n\t-ebe: {}\n\t-o: {}\n\t-iter: {}\n\t-args: {}\n\t-i: {}\n\t-c: {}\n\t-t: {}\n\t-Werror: {}\n\t-resume: {}\n\t-serve: {}\n\t-worker: {}\n\t-jobtimeout: {}".format(
+          _ebec_dir, _ebei_dir, _ebe_command, _json_dir, _iterations, _extra_args, _only_i, _only_c, _tests, werror, _resume,
+          _serve, _worker_addrs, _job_timeout))
 
     _ebec_dir = os.path.normpath(_ebec_dir)
     _ebei_dir = os.path.normpath(_ebei_dir)
     _json_dir = os.path.normpath(_json_dir)
 
+    # Resumed benchmarks continue with the run plan from the journal
+    _plan = {"ebec": _ebec_dir, "ebei": _ebei_dir, "iterations": _iterations, "tests": _tests,
+             "only_i": _only_i, "only_c": _only_c}
+    if _resume is not None:
+        if not os.path.isfile(_resume):
+            error("Journal file '{}' does not exist".format(_resume))
+        _journal_header, _journal_samples, _ = load_journal(_resume)
+        for _k, _v in _journal_header["plan"].items():
+            if _k in _given and _plan[_k] != _v:
+                error("Journal was created with {} '{}', but '{}' was given".format(PLAN_OPTIONS[_k], _v, _plan[_k]))
+            _plan[_k] = _v
+        _ebec_dir, _ebei_dir, _iterations = _plan["ebec"], _plan["ebei"], _plan["iterations"]
+        _tests, _only_i, _only_c = _plan["tests"], _plan["only_i"], _plan["only_c"]
+
     if _only_i and _only_c:
         error("Only -i or -c can be set, not both")
 
@@ -391,21 +862,69 @@ if __name__ == "__main__":
         error("Ebei test directory '{}' does not exist or is not a directory".format(_ebei_dir))
     if not os.path.isdir(_json_dir):
         _json_name = _json_dir
-    if not os.path.isfile(_ebe_command):
+    if _serve is not None and len(_worker_addrs) > 0:
+        error("Only -serve or -worker can be set, not both")
+
+    if not os.path.isfile(_ebe_command) and len(_worker_addrs) == 0:
         # Call ebe as a command
         try:
             subprocess.Popen([_ebe_command], stdout=subprocess.PIPE)
         except FileNotFoundError:
             error("Ebe cannot be found as a command nor binary under '{}'".format(_ebe_command))
 
-    _ebec_results = None
-    _ebei_results = None
+    if _serve is not None:
+        # Worker is unauthenticated, so it is reachable only locally unless host is set
+        run_worker(_ebe_command, _ebec_dir, _ebei_dir, _extra_args, _serve_host if _serve_host else "localhost", _serve)
+
+    _workers = [connect_worker(a, _extra_args, _job_timeout) for a in _worker_addrs]
+    # Samples of different Ebe versions cannot be merged into one results
+    for _w in _workers[1:]:
+        if _w[3]["ebe"] != _workers[0][3]["ebe"]:
+            error("Worker '{}' uses Ebe {}, but worker '{}' uses Ebe {}. Different Ebe versions have to be benchmarked separately".format(
+                  _w[0], _w[3]["ebe"]["version"], _workers[0][0], _workers[0][3]["ebe"]["version"]))
+    _ebe_info = _workers[0][3]["ebe"] if len(_workers) > 0 else get_ebe_info(_ebe_command)
+    # Platforms of distributed benchmarks are tracked for each worker
+    _platform_info = None if len(_workers) > 0 else get_platform_info()
+
+    # Setting up journal
+    if _resume is not None:
+        if _journal_header["args"] != _extra_args:
+            error("Journal was created with -args '{}', but '{}' was given".format(_journal_header["args"], _extra_args))
+        if _journal_header.get("ebe") != _ebe_info:
+            error("Journal was created with Ebe {}, but Ebe {} is used".format(
+                  _journal_header.get("ebe", {}).get("version"), _ebe_info["version"]))
+        if _journal_header.get("platform") != _platform_info:
+            error("Journal was created on a different platform than the current one")
+        if _json_name is None:
+            _json_name = _journal_header["json"]
+        _journal_name = _resume
+        _journal = open_journal(_journal_name)
+        log("Resuming from journal '{}' ({} samples done)".format(_resume, len(_journal_samples)))
+    else:
+        if _json_name is None:
+            _json_name = _json_dir+"/"+datetime.now().strftime("%Y-%m-%d_%H-%M")+"_Ebe"+_ebe_info["version"]+"_benchmarks.json"
+        _journal_samples = []
+        _journal_name = _json_name+JOURNAL_EXT
+        _journal = open_journal(_journal_name, {"version": __version__, "args": _extra_args, "ebe": _ebe_info,
+                                                    "platform": _platform_info, "plan": _plan, "json": _json_name})
+        log("Writing samples to journal '{}'".format(_journal_name))
+    _done = get_done_samples(_journal_samples)
+
     _tests = None if len(_tests) == 0 else _tests
     # Running tests
-    if not _only_i:
-        _ebec_results = run_ebec_tests(_ebe_command, _ebec_dir, _iterations, _extra_args, _tests)
-    if not _only_c:
-        _ebei_results = run_ebei_tests(_ebe_command, _ebei_dir, _iterations, _tests)
+    if len(_workers) > 0:
+        run_distributed_tests(_workers, _ebec_dir, _ebei_dir, _iterations, _tests, _journal, _done, _only_i, _only_c)
+    else:
+        if not _only_i:
+            run_ebec_tests(_ebe_command, _ebec_dir, _iterations, _extra_args, _tests, _journal, _done)
+        if not _only_c:
+            run_ebei_tests(_ebe_command, _ebei_dir, _iterations, _tests, _journal, _done)
+    _journal.close()
+
+    # Assemble results from journal
+    _, _journal_samples, _journal_workers = load_journal(_journal_name)
+    _ebec_results = None if _only_i else get_journal_results(_journal_samples, "ebec", _tests, _iterations)
+    _ebei_results = None if _only_c else get_journal_results(_journal_samples, "ebei", _tests, _iterations)
 
     # Save results
     _results = {"benchmark": {
@@ -413,15 +932,18 @@ if __name__ == "__main__":
                     "time:": int(datetime.now().timestamp()),
                     "args": _extra_args
                     },
-                "platform": get_platform_info(),
-                "ebe": get_ebe_info(_ebe_command),
+                "platform": _platform_info,
+                "ebe": _ebe_info,
                 "results": {
                     "ebec": _ebec_results, 
                     "ebei": _ebei_results
                     }
                }
-    if _json_name is None:
-        _json_name = _json_dir+"/"+datetime.now().strftime("%Y-%m-%d_%H-%M")+"_Ebe"+get_ebe_version(_ebe_command)+"_benchmarks.json"
+    if len(_journal_workers) > 0:
+        # Platform is set only when all workers share it, otherwise see workers
+        _platforms = [w["platform"] for w in _journal_workers.values()]
+        _results["platform"] = _platforms[0] if all(p == _platforms[0] for p in _platforms) else None
+        _results["workers"] = _journal_workers
     with open(_json_name, "w") as json_f:
         json.dump(_results, json_f, indent=2)
 
@@ -42,6 +42,8 @@ def get_plot_text(benchmark_json):
     :return Text to place under the graph
     """
     p = benchmark_json["platform"]
+    if p is None:
+        return "Platform: multiple workers"
     cpu = p["cpu"]["model"]+" @ "+str(p["cpu"]["freq_max"])+" MHz"
     ram = str(round(p["memory"]["size"]/1e9, 2))+" GB"
     os = p["os"]
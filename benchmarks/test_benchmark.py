@@ -0,0 +1,424 @@
+#!/usr/bin/python3
+"""
+Tests for benchmark journal and distributed benchmarks.
+Benchmarks and workers are run on localhost with stub Ebe and measure.sh,
+so no root privileges are needed.
+Run with: python3 -m unittest test_benchmark
+"""
+__author__ = "Marek Sedlacek"
+__date__ = "January 2022"
+
+import unittest
+import subprocess
+import tempfile
+import socket
+import signal
+import threading
+import json
+import time
+import sys
+import os
+import importlib.util
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark.py")
+SUPPORTED = sys.platform.startswith("linux") and importlib.util.find_spec("psutil") is not None
+if SUPPORTED:
+    sys.path.insert(0, os.path.dirname(BENCHMARK))
+    import benchmark
+
+# measure.sh stubs, the real one needs root privileges
+MEASURE_OK = """#!/bin/bash
+echo "Precision 97.5%"
+echo "0.42,99%" >&2
+"""
+MEASURE_COUNT = """#!/bin/bash
+echo >> measured
+echo "Precision 97.5%"
+echo "0.42,99%" >&2
+"""
+MEASURE_HANG = """#!/bin/bash
+touch measuring
+sleep 30
+"""
+
+def free_port():
+    """
+    :return Port, which is currently not used
+    """
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+@unittest.skipUnless(SUPPORTED, "Benchmarks require Linux and psutil")
+class BenchmarkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workers = []
+
+    def tearDown(self):
+        for proc in self.workers:
+            if proc.poll() is None:
+                os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+            proc.stderr.close()
+        self.tmp.cleanup()
+
+    def make_dir(self, name, measure=MEASURE_OK):
+        """
+        Creates directory with one ebec and one ebei test and measure.sh stub
+        :return Path to the directory
+        """
+        path = os.path.join(self.tmp.name, name)
+        files = {"measure.sh": measure,
+                 "ebec/csv/csv.in": "a,b\n", "ebec/csv/csv.out": "b\n",
+                 "ebei/filter/filter.ebel": "", "ebei/filter/random.txt": "1\n"}
+        for f, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(path, f)), exist_ok=True)
+            with open(os.path.join(path, f), "w") as f_w:
+                f_w.write(content)
+        os.chmod(os.path.join(path, "measure.sh"), 0o755)
+        return path
+
+    def make_ebe(self, version="0.3.0"):
+        """
+        Creates Ebe stub printing version
+        :return Path to the stub
+        """
+        path = os.path.join(self.tmp.name, "ebe"+version)
+        with open(path, "w") as f_w:
+            f_w.write("#!/bin/bash\necho \"Ebe {}\"\n".format(version))
+        os.chmod(path, 0o755)
+        return path
+
+    def finish(self, proc, stderr, results):
+        """
+        Collects finished benchmark's output
+        :return Touple of (return code, stderr, results json or None)
+        """
+        if not os.path.isfile(results):
+            return (proc.returncode, stderr.decode("utf-8"), None)
+        with open(results, "r") as f_r:
+            return (proc.returncode, stderr.decode("utf-8"), json.load(f_r))
+
+class TestJournal(BenchmarkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.make_dir("local", MEASURE_COUNT)
+        self.ebe = self.make_ebe()
+        self.journal = os.path.join(self.path, "results.json.journal")
+
+    def run_local(self, *args):
+        """
+        Runs benchmarks locally
+        :return Touple of (return code, stderr, results json or None)
+        """
+        results = os.path.join(self.path, "results.json")
+        if os.path.isfile(results):
+            os.remove(results)
+        proc = subprocess.Popen([sys.executable, BENCHMARK, "-ebe", self.ebe, "-o", results]+list(args),
+                                cwd=self.path, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        _, stderr = proc.communicate(timeout=60)
+        return self.finish(proc, stderr, results)
+
+    def measured(self):
+        """
+        :return Amount of samples measured by measure.sh
+        """
+        with open(os.path.join(self.path, "measured"), "r") as f_r:
+            return len(f_r.readlines())
+
+    def journal_lines(self):
+        """
+        :return Lines of the journal
+        """
+        with open(self.journal, "r") as f_r:
+            return f_r.readlines()
+
+    def test_cut_off_record(self):
+        with open(self.journal, "w") as f_w:
+            f_w.write(json.dumps({"journal": {}})+"\n")
+            f_w.write(json.dumps({"mode": "ebec", "test": "csv", "iteration": 0, "time": 1.0, "cpu": 99})+"\n")
+            f_w.write('{"mode": "eb')
+        journal = benchmark.open_journal(self.journal)
+        benchmark.write_journal(journal, {"mode": "ebec", "test": "csv", "iteration": 1, "time": 1.0, "cpu": 99})
+        journal.close()
+        self.assertEqual(self.journal_lines()[2], '{"mode": "eb\n')
+        header, samples, workers = benchmark.load_journal(self.journal)
+        self.assertEqual(header, {})
+        self.assertEqual([s["iteration"] for s in samples], [0, 1])
+        self.assertEqual(workers, {})
+
+    def test_multiple_headers(self):
+        with open(self.journal, "w") as f_w:
+            f_w.write(json.dumps({"journal": {}})+"\n")
+            f_w.write(json.dumps({"journal": {}})+"\n")
+        with self.assertRaises(SystemExit):
+            benchmark.load_journal(self.journal)
+
+    def test_journal_results(self):
+        samples = [{"mode": m, "test": t, "iteration": i, "time": float(i), "cpu": 99, "precision": 97.5}
+                   for m in ("ebec", "ebei") for t in ("a", "b") for i in (2, 0, 1)]
+        self.assertEqual(benchmark.get_done_samples(samples[:2]), {("ebec", "a", 2), ("ebec", "a", 0)})
+        self.assertEqual(benchmark.get_journal_results(samples, "ebec", ["a"], 2),
+                         {"a": {"times": [0.0, 1.0], "cpus": [99, 99], "precisions": [97.5, 97.5]}})
+        self.assertEqual(list(benchmark.get_journal_results(samples, "ebei", None, 3).keys()), ["a", "b"])
+        self.assertIsNone(benchmark.get_journal_results(samples, "ebec", ["c"], 3))
+
+    def test_existing_journal(self):
+        code, stderr, _ = self.run_local("-iter", "2")
+        self.assertEqual(code, 0, stderr)
+        lines = self.journal_lines()
+        code, stderr, results = self.run_local("-iter", "2")
+        self.assertEqual(code, 1)
+        self.assertIn("use -resume", stderr)
+        self.assertEqual(self.journal_lines(), lines)
+
+    def test_resume_skips_done(self):
+        code, stderr, _ = self.run_local("-iter", "3")
+        self.assertEqual(code, 0, stderr)
+        self.assertEqual(self.measured(), 6)
+        # Simulate crash during the last test
+        lines = self.journal_lines()
+        with open(self.journal, "w") as f_w:
+            f_w.writelines(lines[:-2])
+        code, stderr, results = self.run_local("-resume", self.journal)
+        self.assertEqual(code, 0, stderr)
+        self.assertEqual(self.measured(), 8)
+        self.assertEqual(results["results"]["ebec"]["csv"]["times"], [0.42]*3)
+        self.assertEqual(results["results"]["ebei"]["filter"]["times"], [0.42]*3)
+
+    def test_resume_uses_plan(self):
+        code, stderr, _ = self.run_local("-iter", "2", "-c", "-t", "csv")
+        self.assertEqual(code, 0, stderr)
+        code, stderr, results = self.run_local("-resume", self.journal)
+        self.assertEqual(code, 0, stderr)
+        self.assertEqual(self.measured(), 2)
+        self.assertEqual(results["results"]["ebec"], {"csv": {"times": [0.42]*2, "cpus": [99]*2,
+                                                               "precisions": [97.5]*2}})
+        self.assertIsNone(results["results"]["ebei"])
+        code, stderr, _ = self.run_local("-resume", self.journal, "-iter", "5")
+        self.assertEqual(code, 1)
+        self.assertIn("-iter", stderr)
+
+    def test_resume_checks_ebe_and_platform(self):
+        code, stderr, _ = self.run_local("-iter", "1")
+        self.assertEqual(code, 0, stderr)
+        lines = self.journal_lines()
+        header = json.loads(lines[0])
+        header["journal"]["platform"]["cpu"]["cores"] += 1
+        with open(self.journal, "w") as f_w:
+            f_w.writelines([json.dumps(header)+"\n"]+lines[1:])
+        code, stderr, _ = self.run_local("-resume", self.journal)
+        self.assertEqual(code, 1)
+        self.assertIn("different platform", stderr)
+        self.ebe = self.make_ebe("0.4.0")
+        code, stderr, _ = self.run_local("-resume", self.journal)
+        self.assertEqual(code, 1)
+        self.assertIn("Ebe 0.3.0", stderr)
+
+class TestDistributed(BenchmarkTestCase):
+
+    def start_worker(self, path, ebe):
+        """
+        Starts worker agent in path and waits until it accepts connections
+        :return Worker address
+        """
+        port = free_port()
+        proc = subprocess.Popen([sys.executable, BENCHMARK, "-serve", str(port), "-ebe", ebe], cwd=path,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+        self.workers.append(proc)
+        for _ in range(100):
+            try:
+                socket.create_connection(("localhost", port)).close()
+                return "localhost:{}".format(port)
+            except OSError:
+                if proc.poll() is not None:
+                    self.fail("Worker exited: "+proc.stderr.read().decode("utf-8"))
+                time.sleep(0.1)
+        self.fail("Worker did not start")
+
+    def start_fake_worker(self, reply, hello=None):
+        """
+        Starts worker in a thread, which answers every job with reply
+        :return Worker address
+        """
+        server = socket.create_server(("localhost", 0))
+        self.addCleanup(server.close)
+        if hello is None:
+            hello = {"type": "hello", "platform": benchmark.get_platform_info(), "ebe": {"version": "0.3.0"}, "args": "",
+                     "tests": {"ebec": {}, "ebei": {}}}
+        def serve():
+            conn, _ = server.accept()
+            with conn, conn.makefile("rw") as f_sock:
+                f_sock.write(json.dumps(hello)+"\n")
+                f_sock.flush()
+                for _ in f_sock:
+                    f_sock.write(json.dumps(reply)+"\n")
+                    f_sock.flush()
+        threading.Thread(target=serve, daemon=True).start()
+        return "localhost:{}".format(server.getsockname()[1])
+
+    def coordinator(self, workers, *args):
+        """
+        Starts coordinator
+        :return Coordinator process and path to the results json
+        """
+        path = self.make_dir("coordinator")
+        results = os.path.join(path, "results.json")
+        cmd = [sys.executable, BENCHMARK, "-o", results]
+        for w in workers:
+            cmd += ["-worker", w]
+        proc = subprocess.Popen(cmd+list(args), cwd=path, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return (proc, results)
+
+    def run_coordinator(self, workers, *args):
+        """
+        Runs coordinator until it finishes
+        :return Touple of (return code, stderr, results json or None)
+        """
+        proc, results = self.coordinator(workers, *args)
+        _, stderr = proc.communicate(timeout=60)
+        return self.finish(proc, stderr, results)
+
+    def check_results(self, results, iterations, workers):
+        """
+        Checks that all samples were measured and only by workers
+        """
+        for mode, test in (("ebec", "csv"), ("ebei", "filter")):
+            data = results["results"][mode][test]
+            self.assertEqual(data["times"], [0.42]*iterations)
+            self.assertEqual(data["cpus"], [99]*iterations)
+            self.assertTrue(set(data["workers"]) <= set(workers))
+        self.assertEqual(results["results"]["ebec"]["csv"]["precisions"], [97.5]*iterations)
+
+    def test_merge(self):
+        ebe = self.make_ebe()
+        workers = [self.start_worker(self.make_dir("w1"), ebe), self.start_worker(self.make_dir("w2"), ebe)]
+        code, stderr, results = self.run_coordinator(workers, "-iter", "3")
+        self.assertEqual(code, 0, stderr)
+        self.check_results(results, 3, workers)
+        self.assertEqual(set(results["workers"].keys()), set(workers))
+        self.assertEqual(results["platform"], results["workers"][workers[0]]["platform"])
+        self.assertEqual(results["ebe"]["version"], "0.3.0")
+
+    def test_requeue_on_disconnect(self):
+        ebe = self.make_ebe()
+        hanging_dir = self.make_dir("w2", MEASURE_HANG)
+        workers = [self.start_worker(self.make_dir("w1"), ebe), self.start_worker(hanging_dir, ebe)]
+        proc, results = self.coordinator(workers, "-iter", "5")
+        # Kill worker while it is measuring
+        for _ in range(100):
+            if os.path.isfile(os.path.join(hanging_dir, "measuring")):
+                break
+            time.sleep(0.1)
+        os.killpg(self.workers[1].pid, signal.SIGKILL)
+        _, stderr = proc.communicate(timeout=60)
+        code, stderr, results = self.finish(proc, stderr, results)
+        self.assertEqual(code, 0, stderr)
+        self.assertIn("Returning its job to the queue", stderr)
+        self.check_results(results, 5, workers[:1])
+
+    def test_requeue_on_timeout(self):
+        ebe = self.make_ebe()
+        workers = [self.start_worker(self.make_dir("w1"), ebe),
+                   self.start_worker(self.make_dir("w2", MEASURE_HANG), ebe)]
+        code, stderr, results = self.run_coordinator(workers, "-iter", "5", "-jobtimeout", "1")
+        self.assertEqual(code, 0, stderr)
+        self.assertIn("did not answer in time", stderr)
+        self.check_results(results, 5, workers[:1])
+
+    def test_incorrect_reply(self):
+        workers = [self.start_worker(self.make_dir("w1"), self.make_ebe()), self.start_fake_worker({"time": 1})]
+        code, stderr, results = self.run_coordinator(workers, "-iter", "5")
+        self.assertEqual(code, 0, stderr)
+        self.assertIn("sent incorrect reply", stderr)
+        self.check_results(results, 5, workers[:1])
+
+    def test_different_platforms(self):
+        platform = benchmark.get_platform_info()
+        platform["cpu"]["cores"] += 1
+        hello = {"type": "hello", "platform": platform, "ebe": {"version": "0.3.0"}, "args": "",
+                 "tests": {"ebec": {}, "ebei": {}}}
+        workers = [self.start_worker(self.make_dir("w1"), self.make_ebe()),
+                   self.start_fake_worker({"type": "error", "msg": "Test not found on worker"}, hello)]
+        code, stderr, results = self.run_coordinator(workers)
+        self.assertEqual(code, 0, stderr)
+        self.assertIsNone(results["platform"])
+        self.assertEqual(results["workers"][workers[1]]["platform"], platform)
+
+    def test_incorrect_reply_only_worker(self):
+        code, stderr, results = self.run_coordinator([self.start_fake_worker(3)])
+        self.assertEqual(code, 1)
+        self.assertIn("were not measured", stderr)
+        self.assertNotIn("Traceback", stderr)
+
+    def test_error_reply(self):
+        workers = [self.start_worker(self.make_dir("w1"), self.make_ebe()),
+                   self.start_fake_worker({"type": "error", "msg": "Test not found on worker"})]
+        code, stderr, results = self.run_coordinator(workers, "-iter", "5")
+        self.assertEqual(code, 0, stderr)
+        self.assertIn("Test not found on worker. Returning its job to the queue", stderr)
+        self.assertNotIn("WARNING", stderr)
+        self.check_results(results, 5, workers[:1])
+
+    def test_error_reply_only_worker(self):
+        workers = [self.start_fake_worker({"type": "error", "msg": "Test not found on worker"})]
+        code, stderr, results = self.run_coordinator(workers)
+        self.assertEqual(code, 1)
+        self.assertIn("WARNING", stderr)
+        self.assertIn("Could not measure iteration", stderr)
+
+    def test_different_ebe_versions(self):
+        workers = [self.start_worker(self.make_dir("w1"), self.make_ebe("0.3.0")),
+                   self.start_worker(self.make_dir("w2"), self.make_ebe("0.4.0"))]
+        code, stderr, results = self.run_coordinator(workers)
+        self.assertEqual(code, 1)
+        self.assertIn("Different Ebe versions", stderr)
+        self.assertIsNone(results)
+
+    def test_different_tests(self):
+        path = self.make_dir("w2")
+        with open(os.path.join(path, "ebec", "csv", "csv.in"), "w") as f_w:
+            f_w.write("c,d\n")
+        workers = [self.start_worker(self.make_dir("w1"), self.make_ebe()), self.start_worker(path, self.make_ebe())]
+        code, stderr, results = self.run_coordinator(workers)
+        self.assertEqual(code, 1)
+        self.assertIn("Test 'ebec:csv' on worker '{}' differs".format(workers[1]), stderr)
+        self.assertIsNone(results)
+
+    def test_unexpected_handshake(self):
+        for hello in ([], {"type": "hello", "args": ""}, {"type": "hello", "platform": {}, "ebe": {}, "args": "",
+                                                         "tests": {"ebec": {}, "ebei": {}}}):
+            code, stderr, _ = self.run_coordinator([self.start_fake_worker(3, hello)])
+            self.assertEqual(code, 1)
+            self.assertIn("Unexpected handshake", stderr)
+            self.assertNotIn("Traceback", stderr)
+
+    def test_different_args(self):
+        workers = [self.start_worker(self.make_dir("w1"), self.make_ebe())]
+        code, stderr, _ = self.run_coordinator(workers, "-args", "-expr 1")
+        self.assertEqual(code, 1)
+        self.assertIn("was started with -args", stderr)
+
+    def test_malformed_jobs(self):
+        host, _, port = self.start_worker(self.make_dir("w1"), self.make_ebe()).rpartition(":")
+        with socket.create_connection((host, int(port)), timeout=10) as sock, sock.makefile("rw") as f_sock:
+            self.assertEqual(json.loads(f_sock.readline())["type"], "hello")
+            jobs = [{"type": "job", "mode": "bogus", "test": "csv", "iteration": 0},
+                    {"type": "job", "mode": "ebec", "test": ["csv"], "iteration": 0},
+                    {"type": "job", "mode": "ebec", "test": "csv"},
+                    3,
+                    {"type": "job", "mode": "ebec", "test": "csv", "iteration": 0, "args": "; touch pwned #"}]
+            replies = []
+            for job in jobs:
+                f_sock.write(json.dumps(job)+"\n")
+                f_sock.flush()
+                replies.append(json.loads(f_sock.readline())["type"])
+            self.assertEqual(replies, ["error"]*4+["sample"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "w1", "pwned")))
+        self.assertIsNone(self.workers[0].poll())
+
+if __name__ == "__main__":
+    unittest.main()